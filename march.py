@@ -38,9 +38,10 @@ __homepage__ = 'https://github.com/frispete/march'
 
 
 import os
+import re
 import sys
 import time
-import getopt
+import functools
 
 
 class gpar:
@@ -56,8 +57,6 @@ class gpar:
     license = __license__
     homepage = __homepage__
     march = None
-    # internal
-    kernel_march = None
 
 
 stdout = lambda *msg: print(*msg, file = sys.stdout, flush = True)
@@ -131,13 +130,29 @@ def exit(ret = 0, msg = None, usage = False):
     sys.exit(ret)
 
 
-# Check that a given file can be accessed with the correct mode.
-def _access_check(fn, mode):
-    return (os.path.exists(fn) and os.access(fn, mode))
+# march= at a token boundary (e.g. not rd.march=), compiled once
+_MARCH_RE = re.compile(r'(?:^|\s)march=(\S+)')
+
+
+# fetch the march flavour from the kernel command line
+# cached: /proc/cmdline is constant for the life of the boot
+@functools.lru_cache(maxsize = 1)
+def _kernel_march():
+    try:
+        data = open('/proc/cmdline').read()
+    except OSError as e:
+        log.error(e)
+        return None
+    mo = _MARCH_RE.search(data)
+    if mo:
+        march = mo.group(1)
+        log.info(f'march={march} detected from /proc/cmdline')
+        return march
+    return None
 
 
 # slightly adjusted and simplified (unixoid) version of shutil.which
-def which(cmd, mode=os.F_OK | os.X_OK, path=None):
+def which(cmd: str, mode: int = os.F_OK | os.X_OK, path = None):
     """Given a command, mode, and a PATH string, return the path which
     conforms to the given mode on the PATH, or None if there is no such
     file.
@@ -149,12 +164,13 @@ def which(cmd, mode=os.F_OK | os.X_OK, path=None):
     """
     # a path was provided, short circuit processing
     if os.path.dirname(cmd):
-        if _access_check(cmd, mode):
-            return os.path.abspath(cmd)
+        # os.access() implies existence, no separate os.path.exists() needed
+        if os.access(cmd, mode):
+            # abspath costs a getcwd plus normpath: skip it for
+            # already absolute paths
+            return cmd if cmd.startswith(os.sep) else os.path.abspath(cmd)
         return None
 
-    use_bytes = isinstance(cmd, bytes)
-
     if path is None:
         path = os.environ.get('PATH', None)
         if path is None:
@@ -167,52 +183,66 @@ def which(cmd, mode=os.F_OK | os.X_OK, path=None):
     if not path:
         return None
 
-    if use_bytes:
-        path = os.fsencode(path)
-        path = path.split(os.fsencode(os.pathsep))
-    else:
-        path = os.fsdecode(path)
-        path = path.split(os.pathsep)
+    path = path.split(os.pathsep)
 
-    seen = set()
+    # no dedup of $PATH entries: typical paths are short and unique,
+    # normcase/set bookkeeping costs more than a rare duplicate scan
     for dir in path:
-        normdir = os.path.normcase(dir)
-        if not normdir in seen:
-            seen.add(normdir)
-            name = os.path.join(dir, cmd)
-            if _access_check(name, mode):
-                return name
+        # one scandir() per directory: the directory read already
+        # delivers the metadata, avoiding a stat() per candidate
+        try:
+            with os.scandir(dir or os.curdir) as it:
+                for entry in it:
+                    if entry.name == cmd and entry.is_file() \
+                        and os.access(entry.path, mode):
+                        return entry.path
+        except OSError:
+            # silently skip nonexistent $PATH entries
+            pass
     return None
 
 
-def run(args):
+# resolve the -march sibling of an absolute prog path, or None
+# cached: repeated invocations with identical arguments are free
+@functools.lru_cache(maxsize = 64)
+def _resolve_marchprog(prog: str, march: str):
+    # prog is absolute here: one rsplit replaces two os.path.split calls
+    parts = prog.rsplit(os.sep, 2)
+    if len(parts) == 3:
+        basepath, toppath, exe = parts
+        marchprog = f'{basepath}{os.sep}{toppath}-{march}{os.sep}{exe}'
+        if os.access(marchprog, os.X_OK):
+            return marchprog
+    return None
+
+
+def run(args: list) -> int:
     """execute args via execv from alternative path, if available"""
     log.info(f'[{gpar.pid}]: started: {args}')
-    march = gpar.march or gpar.kernel_march
-    prog = which(args[0])
-    if prog:
-        if march:
+    march = gpar.march or _kernel_march()
+    if march:
+        # we need the resolved location to construct the -march sibling
+        prog = which(args[0])
+        if prog:
             log.debug(f'try to locate an -{march} alternative for {prog}')
-            pth, exe = os.path.split(prog)
-            basepath, toppath = os.path.split(pth)
-            marchpath = os.path.join(basepath, toppath + '-' + march)
-            marchprog = os.path.join(marchpath, exe)
-            if _access_check(marchprog, os.X_OK):
+            marchprog = _resolve_marchprog(prog, march)
+            if marchprog:
                 args[0] = marchprog
         else:
-            log.warning(f'neither --march nor march via /proc/cmdline provided: '
-                         'will exec {args} verbatim')
-        # replace this process with new new one
-        try:
-            os.execvp(args[0], args)
-        except Exception as e:
-            log.error(e)
+            errmsg = f'executable "{args[0]}" not found'
+            if not os.path.dirname(args[0]):
+                errmsg += ' in $PATH'
+            log.error(errmsg)
+            return 127
     else:
-        prog = args[0]
-        errmsg = f'executable "{prog}" not found'
-        if not os.path.dirname(prog):
-            errmsg += 'in $PATH'
-        log.error(errmsg)
+        log.warning(f'neither --march nor march via /proc/cmdline provided: '
+                     'will exec {args} verbatim')
+    # replace this process with the new one: execvp delegates any
+    # remaining $PATH search to the C library
+    try:
+        os.execvp(args[0], args)
+    except Exception as e:
+        log.error(e)
     # error condition: executable not found
     return 127
 
@@ -222,37 +252,45 @@ def main(argv = None):
     if argv is None:
         argv = sys.argv[1:]
 
-    try:
-        optlist, args = getopt.getopt(argv, 'hVvm:',
-            ('help', 'version', 'verbose', 'march=')
-        )
-    except getopt.error as msg:
-        exit(1, msg, True)
-
-    for opt, par in optlist:
-        if opt in ('-h', '--help'):
+    # hand-rolled option parser: a handful of flags doesn't justify
+    # importing getopt on the hot path
+    i = 0
+    argc = len(argv)
+    while i < argc:
+        arg = argv[i]
+        if arg == '--':
+            i += 1
+            break
+        if arg == '-' or not arg.startswith('-'):
+            break
+        i += 1
+        if arg in ('-h', '--help'):
             exit(usage = True)
-        elif opt in ('-V', '--version'):
+        elif arg in ('-V', '--version'):
             exit(msg = 'version %s' % gpar.version)
-        elif opt in ('-v', '--verbose'):
+        elif arg in ('-m', '--march'):
+            if i >= argc:
+                exit(1, f'option {arg} requires argument', True)
+            gpar.march = argv[i]
+            i += 1
+        elif arg.startswith('--march='):
+            gpar.march = arg[8:]
+        elif arg.startswith('-m') and arg[1] != '-':
+            gpar.march = arg[2:]
+        elif arg == '--verbose':
             log.setLevel(log.getLevel() - 10)
-        elif opt in ('-m', '--march'):
-            gpar.march = par
+        elif set(arg[1:]) == {'v'}:
+            # -v is cumulative: -vv works as well
+            for _ in arg[1:]:
+                log.setLevel(log.getLevel() - 10)
+        else:
+            exit(1, f'option {arg} not recognized', True)
+
+    args = argv[i:]
 
     if not args:
         exit(1, 'no prog provided', True)
 
-    try:
-        cmdline = open('/proc/cmdline').read().split()
-    except Exception as e:
-        log.error(e)
-
-    for arg in cmdline:
-        if arg.startswith('march='):
-            gpar.kernel_march = arg[6:]
-            log.info(f'march={gpar.kernel_march} detected from /proc/cmdline')
-            break
-
     try:
         return run(args)
     except KeyboardInterrupt: